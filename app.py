@@ -1,27 +1,155 @@
+import threading
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
+import numpy as np
 import pandas as pd
 from simulation import SimulationEnvironment # Importa tu clase de simulación
 # Asegúrate de importar TODOS los tipos necesarios de models
-from models import ProductionStatus, PurchaseStatus, ProductType
+from models import ProductionStatus, PurchaseStatus, ProductType, RAW
+
+# --- Construcción de Tablas (cacheadas) ---
+@st.cache_data(max_entries=512, show_spinner=False)
+def build_bom_df(product_id: int, order_qty: int, inv_snapshot: tuple,
+                 product_names: tuple, bom_tuple: tuple) -> pd.DataFrame:
+    """
+    Construye la tabla de materiales requeridos para un pedido.
+
+    Solo recibe tipos primitivos hashables para que Streamlit pueda reutilizar
+    la tabla en los reruns donde ni el pedido ni el stock implicado cambian.
+    """
+    stock = dict(inv_snapshot)
+    mat_ids = np.array([m for m, _ in bom_tuple], dtype=np.int64)
+    unit_qty = np.array([q for _, q in bom_tuple], dtype=np.int64)
+    current_stock = np.array([stock.get(m, 0) for m, _ in bom_tuple], dtype=np.int64)
+    # Cálculos por columnas en lugar de operaciones escalares por fila
+    total_needed = unit_qty * order_qty
+    missing = np.clip(total_needed - current_stock, 0, None)
+    return pd.DataFrame({
+        "Material ID": mat_ids, "Nombre": list(product_names),
+        "Nec./Unidad": unit_qty, "Total Nec.": total_needed,
+        "Stock": current_stock, "Faltante (Pedido)": missing
+    })
+
+def get_bom_df(sim, order, bom) -> pd.DataFrame:
+    """Prepara las claves de caché de un pedido y devuelve su tabla de BOM."""
+    mats = [item.material_id for item in bom]
+    with get_sim_lock():
+        stock = sim.stock_of(mats).tolist()
+    return build_bom_df(order.product_id, order.quantity,
+                        tuple(zip(mats, stock)),
+                        tuple(PIDX.get(m, (f"ID {m}", ""))[0] for m in mats),
+                        tuple((i.material_id, i.quantity) for i in bom))
+
+# Las tablas siguientes dependen del estado dinámico de la simulación y se
+# cachean por sim.state_version, que solo avanza cuando cambia ese estado.
+# La simulación se comparte entre sesiones: al reconstruirlas se lee bajo
+# get_sim_lock(), porque también se actualizan las vistas internas de la simulación.
+
+@st.cache_data(show_spinner=False, hash_funcs={SimulationEnvironment: id})
+def build_orders_df(state_version: int, sim, sim_version: int) -> pd.DataFrame:
+    """Tabla de pedidos pendientes (sin la columna de selección)."""
+    pidx = product_index(sim, sim_version)
+    with get_sim_lock():
+        pending_df = sim.orders_with_status("pendiente")
+    return pd.DataFrame({
+        "ID": pending_df["id"].to_numpy(),
+        "Producto": [pidx.get(pid, (f"ID {pid}", ""))[0] for pid in pending_df["product_id"].tolist()],
+        "Cantidad": pending_df["quantity"].to_numpy(),
+        "Fecha Creación": pending_df["creation_date"].to_numpy(),
+    })
+
+@st.cache_data(show_spinner=False, hash_funcs={SimulationEnvironment: id})
+def build_shortage_df(state_version: int, sim, sim_version: int) -> pd.DataFrame:
+    """Tabla de faltantes para los pedidos pendientes y liberados."""
+    with get_sim_lock():
+        shortage_orders_df = sim.orders_with_status("pendiente", "liberado")
+        needs = pd.Series(sim.calculate_needs_vector(shortage_orders_df["product_id"].tolist(),
+                                                     shortage_orders_df["quantity"].tolist()),
+                          index=sim.product_ids, name="Necesario")
+        s_stock = pd.Series(sim.inventory_array.copy(), index=sim.product_ids, name="Stock Actual")
+    # Un único join alineado por ID en lugar de una consulta al inventario por fila
+    df = pd.concat([needs, s_stock], axis=1, join="inner")
+    df["Cantidad Faltante"] = df["Necesario"] - df["Stock Actual"]
+    df = df[df["Cantidad Faltante"] > 0].rename_axis("ID Material").reset_index()
+
+    names = pd.Series({pid: name for pid, (name, _) in product_index(sim, sim_version).items()})
+    df["Nombre"] = df["ID Material"].map(names)
+    return df[["ID Material", "Nombre", "Cantidad Faltante", "Stock Actual"]]
+
+@st.cache_data(show_spinner=False, hash_funcs={SimulationEnvironment: id})
+def build_inventory_df(state_version: int, sim, sim_version: int) -> pd.DataFrame:
+    """Tabla de inventario construida por columnas (solo productos conocidos)."""
+    pidx = product_index(sim, sim_version)
+    # Solo se reconstruye cuando cambia state_version, así que el orden se calcula aquí
+    ids = np.fromiter(sorted(pid for pid in sim.inventory if pid in pidx), dtype=np.int64)
+    with get_sim_lock():
+        qtys = sim.stock_of(ids.tolist())
+    names = [pidx[i][0] for i in ids.tolist()]
+    types = [pidx[i][1].capitalize() for i in ids.tolist()]
+    return pd.DataFrame({"ID": ids, "Nombre Producto": names, "Tipo": types, "Cantidad": qtys})
+
+@st.cache_resource(hash_funcs={SimulationEnvironment: id})
+def product_index(sim, sim_version: int) -> dict:
+    """Índice plano {product_id: (nombre, tipo)} para los bucles de renderizado."""
+    return {pid: (p.name, p.type) for pid, p in sim.products.items()}
+
+@st.cache_resource(hash_funcs={SimulationEnvironment: id})
+def supplier_index(sim, sim_version: int) -> dict:
+    """Índice plano {supplier_id: nombre}."""
+    return {sid: s.name for sid, s in sim.suppliers.items()}
+
+@st.cache_resource(hash_funcs={SimulationEnvironment: id})
+def _raw_materials(sim) -> dict:
+    """Materias primas de la simulación, construidas una sola vez por instancia."""
+    return {p.id: p for p in sim.products.values() if p.type == RAW}
+
+@st.cache_data(show_spinner=False, hash_funcs={SimulationEnvironment: id})
+def supplier_labels(sim, sim_version: int) -> dict:
+    """Etiquetas {product_id: {sup_id: texto}} de los proveedores de cada producto."""
+    supplier_names = supplier_index(sim, sim_version)
+    labels = {pid: {} for pid in sim.products}
+    # Un recorrido por los arrays de cada proveedor en lugar de productos x proveedores
+    for sup_id, supplier in sim.suppliers.items():
+        ids, costs, lead_times = supplier.supply_arrays()
+        for pid, cost, lead_time in zip(ids.tolist(), costs.tolist(), lead_times.tolist()):
+            if pid in labels:
+                labels[pid][sup_id] = f"{supplier_names[sup_id]} ({cost:.2f}€, {lead_time}d)"
+    return labels
 
 # --- Inicialización y Gestión del Estado ---
+@st.cache_resource
+def get_sim() -> SimulationEnvironment:
+    """Crea la simulación una sola vez por proceso; se comparte entre sesiones."""
+    sim_env = SimulationEnvironment("config_initial.json")
+    # Iniciar procesos SimPy que corren continuamente
+    sim_env.env.process(sim_env.daily_demand_generator())
+    print("Simulation initialized and cached.")
+    return sim_env
+
+@st.cache_resource
+def get_sim_lock() -> threading.Lock:
+    """
+    Cerrojo de la simulación compartida.
+
+    Cada sesión ejecuta su script en su propio hilo: los callbacks que
+    modifican la simulación (avanzar día, liberar, comprar) lo adquieren para
+    no ejecutar env.run ni tocar el inventario a la vez desde dos sesiones.
+    Las lecturas de pedidos e inventario de los paneles también, porque
+    reconstruyen las vistas internas de la simulación. No es reentrante.
+    """
+    return threading.Lock()
+
 def initialize_simulation():
-    """Inicializa la simulación si no existe en el estado de la sesión."""
+    """Asocia la simulación compartida a la sesión e inicializa el estado de la UI."""
     if 'sim' not in st.session_state:
-        st.info("Inicializando entorno de simulación...")
         try:
-            sim_env = SimulationEnvironment("config_initial.json")
-            st.session_state.sim = sim_env
-            # Iniciar procesos SimPy que corren continuamente
-            st.session_state.sim.env.process(st.session_state.sim.daily_demand_generator())
-            # Inicializar variables de estado de la UI
-            st.session_state.current_day = sim_env.sim_start_day
-            st.session_state.selected_orders_to_release = set() # Inicializa el set para la selección
-            print("Simulation initialized and stored in session state.")
-            st.success("Entorno de simulación listo.")
+            st.session_state.sim = get_sim()
         except Exception as e:
             st.error(f"Error fatal al inicializar la simulación: {e}")
             st.stop()
+    # Otra sesión puede haber avanzado la simulación compartida
+    st.session_state.current_day = st.session_state.sim.current_day
+    st.session_state.setdefault('sim_version', 0) # Versión de los datos maestros (productos/proveedores)
 
 # --- Funciones Callback para Botones ---
 def advance_day_callback():
@@ -30,7 +158,8 @@ def advance_day_callback():
         try:
             current_day_before_run = st.session_state.current_day
             print(f"UI: Requesting run_day from day {current_day_before_run}")
-            st.session_state.sim.run_day()
+            with get_sim_lock():
+                st.session_state.sim.run_day()
             st.session_state.current_day = st.session_state.sim.current_day # Actualiza día después de correr
             print(f"UI: Day advanced to {st.session_state.current_day}")
             st.success(f"Simulación avanzada al final del día {current_day_before_run}.")
@@ -39,11 +168,11 @@ def advance_day_callback():
     else:
         st.error("La simulación no está inicializada.")
 
-def release_orders_callback():
-    """Callback para el botón 'Liberar Seleccionados'."""
-    if 'sim' in st.session_state and 'selected_orders_to_release' in st.session_state:
+def release_orders_callback(orders_to_process):
+    """Callback para el botón 'Liberar Seleccionados' con los IDs marcados en la tabla."""
+    if 'sim' in st.session_state and orders_to_process:
         sim = st.session_state.sim
-        orders_to_process = list(st.session_state.selected_orders_to_release)
+        orders_to_process = list(orders_to_process)
         released_count = 0
         errors = []
         print(f"UI: Attempting to release IDs: {orders_to_process}")
@@ -56,24 +185,26 @@ def release_orders_callback():
                  errors.append(f"Excepción liberando orden {order_id}: {e}")
                  return False # Considera la excepción como fallo
 
-        for order_id in orders_to_process:
-             if try_release(order_id):
-                 released_count += 1
-             #else: # Opcional: añadir a errores si devuelve False
-             #    errors.append(f"No se pudo liberar orden {order_id} (ya procesada?).")
+        with get_sim_lock():
+            for order_id in orders_to_process:
+                 if try_release(order_id):
+                     released_count += 1
+                 #else: # Opcional: añadir a errores si devuelve False
+                 #    errors.append(f"No se pudo liberar orden {order_id} (ya procesada?).")
 
 
+        # Se usan toasts porque el panel se reejecuta justo después de liberar
         if released_count > 0:
-            st.success(f"Solicitud de liberación enviada para {released_count} pedido(s).")
+            st.toast(f"Solicitud de liberación enviada para {released_count} pedido(s).", icon="✅")
         if errors:
             for error in errors:
-                st.warning(error)
+                st.toast(error, icon="⚠️")
 
-        # Limpiar la selección después del intento
-        st.session_state.selected_orders_to_release = set()
+        # Limpiar la selección después del intento (editor nuevo, casillas desmarcadas)
+        st.session_state.orders_editor_version = st.session_state.get('orders_editor_version', 0) + 1
         print("UI: Selection cleared after release attempt.")
     else:
-        st.warning("No hay pedidos seleccionados para liberar o la simulación no está lista.")
+        st.toast("No hay pedidos seleccionados para liberar o la simulación no está lista.", icon="⚠️")
 
 
 def create_purchase_order_callback():
@@ -87,7 +218,8 @@ def create_purchase_order_callback():
         if product_id and supplier_id and quantity > 0:
             try:
                 print(f"UI: Requesting creation of PO: Prod={product_id}, Supp={supplier_id}, Qty={quantity}")
-                new_po = sim.create_purchase_order(supplier_id, product_id, quantity)
+                with get_sim_lock():
+                    new_po = sim.create_purchase_order(supplier_id, product_id, quantity)
                 if new_po:
                     st.success(f"Orden de Compra {new_po.id} creada exitosamente.")
                     # No necesitas rerun aquí porque el form ya lo causa
@@ -100,136 +232,103 @@ def create_purchase_order_callback():
     else:
         st.error("La simulación no está inicializada.")
 
-# --- Renderizado de la Interfaz de Usuario ---
-
-st.set_page_config(layout="wide")
-st.title("Interfaz del Simulador de Producción 3D")
-
-# Inicializar simulación al principio
-initialize_simulation()
-
-# Acceder a la instancia de simulación desde el estado de la sesión
-# Comprobar si la simulación se inicializó correctamente
-if 'sim' not in st.session_state:
-    st.error("La simulación no se pudo inicializar. Por favor, revise la consola.")
-    st.stop() # Detener la ejecución si no hay simulación
-sim = st.session_state.sim
-
-# --- Header: Día Actual y Botón de Avanzar ---
-col_head1, col_head2 = st.columns([3, 1])
-with col_head1:
-    st.header(f"Día de Simulación Actual: {st.session_state.get('current_day', 'N/A')}")
-with col_head2:
-    st.button("Avanzar 1 Día >>", on_click=advance_day_callback, key="advance_button")
-
-st.divider()
-
-# --- Layout Principal (dos columnas) ---
-col_izq, col_der = st.columns(2)
+# --- Paneles (fragmentos) ---
+# Cada panel es un fragmento (los dos de pedidos comparten uno): la interacción
+# con sus widgets solo vuelve a ejecutar ese fragmento, no el script completo.
+
+@st.fragment(run_every=None)
+def render_orders_column(sim):
+    """
+    Columna de pedidos: pendientes y en cola/producción en un mismo fragmento.
+
+    Liberar solo reejecuta este fragmento, que incluye los dos paneles, así
+    que los pedidos liberados pasan a la vez de un panel al otro. La
+    liberación no cambia el stock: inventario, faltantes y compras se
+    refrescan en el siguiente rerun completo (p. ej. al avanzar el día).
+    """
+    render_pending_panel(sim)
+    st.divider()
+    render_active_panel(sim)
 
-with col_izq:
-    # --- Panel Pedidos Pendientes ---
+def render_pending_panel(sim):
+    """Panel de pedidos pendientes con selección para liberar."""
     st.subheader("📦 Pedidos de Fabricación Pendientes")
-    pending_orders = [o for o in sim.production_orders if o.status == "pendiente"]
+    orders_df = build_orders_df(sim.state_version, sim,
+                                st.session_state.get('sim_version', 0))
 
-    if not pending_orders:
+    if orders_df.empty:
         st.info("No hay pedidos de fabricación pendientes.")
     else:
-        current_selection_set = st.session_state.setdefault('selected_orders_to_release', set())
-        # --- INICIO: BUCLE PARA PEDIDOS PENDIENTES ---
-        for order in pending_orders:
-            product = sim.get_product(order.product_id)
-            product_name = product.name if product else f"ID {order.product_id}"
-
-            col_a, col_b, col_c = st.columns([2,1,1])
-            with col_a:
-                 st.write(f"**ID {order.id}:** {order.quantity} x {product_name}")
-            with col_b:
-                 st.write(f"Creado Día: {order.creation_date}")
-            with col_c:
-                 is_selected = order.id in current_selection_set
-                 selected = st.checkbox("Liberar", key=f"select_{order.id}", value=is_selected)
-                 # Actualizar el set si el estado del checkbox cambió
-                 if selected and not is_selected:
-                     current_selection_set.add(order.id)
-                 elif not selected and is_selected:
-                     current_selection_set.discard(order.id)
-
+        orders_df["Seleccionar"] = False
+        # Dentro de un formulario las casillas no provocan un rerun por clic:
+        # toda la selección se envía de una vez con "Liberar Seleccionados".
+        with st.form("select_orders_form", border=False):
+            # La clave cambia tras cada liberación para que las ediciones (guardadas
+            # por posición de fila) no se apliquen a otros pedidos
+            editor_key = f"orders_editor_{st.session_state.get('orders_editor_version', 0)}"
+            edited_df = st.data_editor(
+                orders_df,
+                column_config={"Seleccionar": st.column_config.CheckboxColumn("Liberar")},
+                disabled=["ID", "Producto", "Cantidad", "Fecha Creación"],
+                hide_index=True, use_container_width=True, key=editor_key
+            )
+            submitted = st.form_submit_button("Liberar Seleccionados")
+        if submitted:
+            release_orders_callback([int(i) for i in edited_df.loc[edited_df["Seleccionar"], "ID"]])
+            try:
+                st.rerun(scope="fragment")
+            except StreamlitAPIException:
+                # El envío llegó en un rerun completo (no de fragmento)
+                st.rerun()
+
+        # --- BOM de un pedido (un único panel en lugar de un expander por pedido) ---
+        with get_sim_lock():
+            pending_df = sim.orders_with_status("pendiente")
+        orders_by_id = {o.id: o for o in pending_df.itertuples(index=False)}
+        bom_order_id = st.selectbox(
+            "Ver BOM de pedido:", options=list(orders_by_id.keys()),
+            format_func=lambda x: f"Pedido {x}", key="pending_bom_order"
+        )
+        if bom_order_id is not None:
+            order = orders_by_id[bom_order_id]
             bom = sim.get_bom(order.product_id)
             if bom:
-                with st.expander(f"Ver Materiales Requeridos (Pedido {order.id})"):
-                    bom_data = []
-                    for item in bom:
-                        mat_product = sim.get_product(item.material_id)
-                        mat_name = mat_product.name if mat_product else f"ID {item.material_id}"
-                        total_needed = item.quantity * order.quantity
-                        current_stock = sim.inventory.get(item.material_id, 0)
-                        bom_data.append({
-                            "Material ID": item.material_id, "Nombre": mat_name,
-                            "Nec./Unidad": item.quantity, "Total Nec.": total_needed,
-                            "Stock": current_stock, "Faltante (Pedido)": max(0, total_needed - current_stock)
-                        })
-                    if bom_data:
-                        bom_df = pd.DataFrame(bom_data)
-                        st.dataframe(bom_df, hide_index=True, use_container_width=True)
-                    else:
-                        st.info("No se pudieron obtener detalles del BOM.")
-            st.markdown("---")
-        # --- FIN: BUCLE PARA PEDIDOS PENDIENTES ---
-
-        # --- BOTÓN DE LIBERAR (FUERA DEL BUCLE) ---
-        st.button("Liberar Seleccionados",
-                  on_click=release_orders_callback,
-                  key="release_button",
-                  disabled=not current_selection_set # Deshabilitar si no hay nada seleccionado
-                 )
-
-    st.divider()
+                bom_df = get_bom_df(sim, order, bom)
+                if not bom_df.empty:
+                    st.dataframe(bom_df, hide_index=True, use_container_width=True)
+                else:
+                    st.info("No se pudieron obtener detalles del BOM.")
 
-    # --- Panel Pedidos Liberados/En Progreso ---
+def render_active_panel(sim):
+    """Panel de pedidos liberados o en producción."""
     st.subheader("🏭 Pedidos en Cola / Producción")
-    active_orders = [o for o in sim.production_orders if o.status in ["liberado", "en_progreso"]]
-    if not active_orders:
+    with get_sim_lock():
+        active_df = sim.orders_with_status("liberado", "en_progreso")
+    if active_df.empty:
         st.info("No hay pedidos liberados o en producción.")
     else:
-        for order in active_orders:
-            product = sim.get_product(order.product_id)
-            product_name = product.name if product else f"ID {order.product_id}"
+        for order in active_df.itertuples(index=False):
+            product_name = PIDX.get(order.product_id, (f"ID {order.product_id}", ""))[0]
             st.write(f"**ID {order.id}:** {order.quantity} x {product_name} - Estado: **{order.status.upper()}**")
             bom = sim.get_bom(order.product_id)
-            if bom:
-                with st.expander(f"Ver Materiales Requeridos (Pedido {order.id})"):
-                   bom_data = []
-                   for item in bom:
-                       mat_product = sim.get_product(item.material_id)
-                       mat_name = mat_product.name if mat_product else f"ID {item.material_id}"
-                       total_needed = item.quantity * order.quantity
-                       current_stock = sim.inventory.get(item.material_id, 0)
-                       bom_data.append({
-                           "Material ID": item.material_id, "Nombre": mat_name,
-                           "Nec./Unidad": item.quantity, "Total Nec.": total_needed,
-                           "Stock": current_stock, "Faltante (Pedido)": max(0, total_needed - current_stock)
-                       })
-                   if bom_data:
-                        bom_df = pd.DataFrame(bom_data)
-                        st.dataframe(bom_df, hide_index=True, use_container_width=True)
-                   else:
-                        st.info("No se pudieron obtener detalles del BOM.")
+            # El cuerpo de un expander se ejecuta aunque esté cerrado; con un
+            # toggle la tabla solo se construye para los pedidos abiertos
+            if bom and st.toggle(f"Ver Materiales Requeridos (Pedido {order.id})",
+                                 key=f"bom_open_{order.id}"):
+                bom_df = get_bom_df(sim, order, bom)
+                if not bom_df.empty:
+                    st.dataframe(bom_df, hide_index=True, use_container_width=True)
+                else:
+                    st.info("No se pudieron obtener detalles del BOM.")
             st.markdown("---")
 
-with col_der:
-    # --- Panel Inventario ---
+@st.fragment
+def render_inventory_panel(sim):
+    """Panel de inventario actual."""
     st.subheader("📊 Inventario Actual")
-    inventory_data = []
-    for prod_id, quantity in sorted(sim.inventory.items()):
-        product = sim.get_product(prod_id)
-        if product:
-            inventory_data.append({
-                "ID": prod_id, "Nombre Producto": product.name,
-                "Tipo": product.type.capitalize(), "Cantidad": quantity
-            })
-    if inventory_data:
-        inventory_df = pd.DataFrame(inventory_data)
+    inventory_df = build_inventory_df(sim.state_version, sim,
+                                      st.session_state.get('sim_version', 0))
+    if not inventory_df.empty:
         # Formatear columnas si es necesario (opcional)
         st.dataframe(inventory_df, hide_index=True, use_container_width=True,
                      column_config={"ID": st.column_config.NumberColumn(format="%d"),
@@ -237,37 +336,28 @@ with col_der:
     else:
         st.warning("Inventario vacío o no disponible.")
 
-    st.divider()
-
-    # --- Panel Faltantes Globales ---
+@st.fragment
+def render_shortage_panel(sim):
+    """Panel de faltantes de materiales para pedidos pendientes y liberados."""
     st.subheader("⚠️ Faltantes de Materiales")
-    orders_for_shortage_calc = [o for o in sim.production_orders if o.status in ["liberado", "pendiente"]]
-    shortages = sim.calculate_shortages(orders_for_shortage_calc)
+    shortage_df = build_shortage_df(sim.state_version, sim,
+                                    st.session_state.get('sim_version', 0))
 
-    if not shortages:
+    if shortage_df.empty:
         st.success("No hay faltantes de materiales críticos para los pedidos considerados.")
     else:
         st.warning("Se detectan los siguientes faltantes:")
-        shortage_data = []
-        for mat_id, qty_short in shortages.items():
-            product = sim.get_product(mat_id)
-            product_name = product.name if product else f"ID {mat_id}"
-            shortage_data.append({
-                "ID Material": mat_id, "Nombre": product_name,
-                "Cantidad Faltante": qty_short, "Stock Actual": sim.inventory.get(mat_id, 0)
-            })
-        shortage_df = pd.DataFrame(shortage_data)
         st.dataframe(shortage_df, hide_index=True, use_container_width=True,
                      column_config={"ID Material": st.column_config.NumberColumn(format="%d"),
                                      "Cantidad Faltante": st.column_config.NumberColumn(format="%d"),
                                      "Stock Actual": st.column_config.NumberColumn(format="%d")})
 
-    st.divider()
-
-    # --- Panel Compras ---
+@st.fragment
+def render_purchase_form(sim):
+    """Formulario para emitir órdenes de compra."""
     st.subheader("🛒 Emitir Órdenes de Compra")
     with st.form("purchase_order_form", clear_on_submit=True):
-        raw_materials = {p.id: p for p in sim.products.values() if p.type == "raw"}
+        raw_materials = _raw_materials(sim)
         if not raw_materials:
             st.warning("No hay materias primas definidas en la configuración.")
             # Deshabilitar el resto del formulario si no hay materias primas
@@ -279,13 +369,8 @@ with col_der:
                 key='purchase_product_id', index=0 # Seleccionar el primero por defecto
             )
 
-            available_suppliers = {}
-            if selected_product_id:
-                suppliers_details = sim.get_supplier_details_for_product(selected_product_id)
-                for sup_id, cost, lead_time in suppliers_details:
-                    supplier = sim.get_supplier(sup_id)
-                    if supplier:
-                        available_suppliers[sup_id] = f"{supplier.name} ({cost:.2f}€, {lead_time}d)"
+            labels = supplier_labels(sim, st.session_state.get('sim_version', 0))
+            available_suppliers = labels.get(selected_product_id, {})
 
             selected_supplier_id = st.selectbox(
                 "Proveedor:", options=list(available_suppliers.keys()),
@@ -306,6 +391,46 @@ with col_der:
                 # La lógica de creación se maneja en el callback global al detectar el submit
                  create_purchase_order_callback() # Llamar al callback
 
+# --- Renderizado de la Interfaz de Usuario ---
+
+st.set_page_config(layout="wide")
+st.title("Interfaz del Simulador de Producción 3D")
+
+# Inicializar simulación al principio
+initialize_simulation()
+
+# Acceder a la instancia de simulación desde el estado de la sesión
+# Comprobar si la simulación se inicializó correctamente
+if 'sim' not in st.session_state:
+    st.error("La simulación no se pudo inicializar. Por favor, revise la consola.")
+    st.stop() # Detener la ejecución si no hay simulación
+sim = st.session_state.sim
+PIDX = product_index(sim, st.session_state.get('sim_version', 0))
+
+# --- Header: Día Actual y Botón de Avanzar ---
+col_head1, col_head2 = st.columns([3, 1])
+with col_head1:
+    st.header(f"Día de Simulación Actual: {st.session_state.get('current_day', 'N/A')}")
+with col_head2:
+    st.button("Avanzar 1 Día >>", on_click=advance_day_callback, key="advance_button")
+
+st.divider()
+
+# --- Layout Principal (dos columnas) ---
+# El botón "Avanzar Día" queda fuera de los fragmentos y provoca un rerun completo.
+
+col_izq, col_der = st.columns(2)
+
+with col_izq:
+    render_orders_column(sim)
+
+with col_der:
+    render_inventory_panel(sim)
+    st.divider()
+    render_shortage_panel(sim)
+    st.divider()
+    render_purchase_form(sim)
+
 
 # --- Sidebar (Opcional) ---
 st.sidebar.title("Opciones")
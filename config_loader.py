@@ -1,81 +1,310 @@
 import json
-from typing import Dict, List, Tuple
+import logging
+import mmap
+import os
+import pickle
+import sys
+from collections.abc import Mapping
+from functools import cache
+from operator import itemgetter
+try:
+    import orjson # Parser en C, bastante más rápido que json (opcional)
+except ImportError:
+    orjson = None
+from typing import Dict, List, Optional, Tuple
+from pydantic import TypeAdapter, ValidationError
 # Asegúrate que models.py esté en el mismo directorio o sea accesible
-from models import Product, Supplier, InventoryItem, BOMItem
+from models import Product, Supplier, InventoryItem, BOMItem, ConfigSchema, FINISHED
 
-def load_initial_config(filepath: str) -> Dict:
+logger = logging.getLogger(__name__)
+
+# Validador del esquema completo, construido en la primera carga validada (la
+# carga por defecto no valida y así no paga su construcción al importar): cada
+# carga validada es después una única llamada a pydantic-core
+@cache
+def _config_validator() -> TypeAdapter:
+    adapter = TypeAdapter(ConfigSchema)
+    adapter.rebuild(force=True) # Los modelos usan defer_build: se fuerza la construcción
+    return adapter
+
+# Líneas de BOM: validación de la lista completa, o construcción directa sin validar
+@cache
+def _bom_validator() -> TypeAdapter:
+    return TypeAdapter(List[BOMItem])
+
+_bom_fields = itemgetter("material_id", "quantity")
+
+# Configuraciones ya cargadas: {(ruta, mtime, tamaño, validate): estado inicial}
+_CONFIG_CACHE: Dict[Tuple[str, int, int, bool], Dict] = {}
+
+# Versión del formato de la caché binaria: cambiarla cuando cambie cualquier
+# tipo que se guarda en ella (modelos, BOMItem...) para descartar las antiguas
+_SIDECAR_FORMAT = 2 # 2: BOMItem pasa a ser una NamedTuple
+
+def _sidecar_path(filepath: str, validate: bool) -> str:
+    """Ruta de la caché binaria (pickle) que acompaña al JSON (una por formato y modo de carga)."""
+    return f"{filepath}.v{_SIDECAR_FORMAT}-{'validated' if validate else 'trusted'}.pkl"
+
+def _load_sidecar(filepath: str, stat: os.stat_result, validate: bool) -> Dict:
+    """Devuelve el estado guardado en la caché binaria si corresponde a esta versión del JSON."""
+    try:
+        with open(_sidecar_path(filepath, validate), 'rb') as f:
+            cached = pickle.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e: # Caché corrupta o de tipos incompatibles: se vuelve a parsear el JSON
+        logger.warning("Caché de configuración %s descartada: %s", _sidecar_path(filepath, validate), e)
+        return {}
+    # Solo vale si es de este formato y se generó a partir del mismo JSON
+    if not isinstance(cached, dict) or cached.get("format") != _SIDECAR_FORMAT:
+        return {}
+    if (cached.get("mtime_ns"), cached.get("size")) != (stat.st_mtime_ns, stat.st_size):
+        return {}
+    return cached.get("state", {})
+
+def _write_sidecar(filepath: str, stat: os.stat_result, validate: bool, state: Mapping):
+    """Guarda el estado parseado junto al JSON para saltarse el parseo en el próximo arranque."""
+    # Se guardan los modelos ya construidos: con un LazyConfig solo se llama
+    # cuando ya se accedió a todas sus listas (ver load_initial_config)
+    payload = {"format": _SIDECAR_FORMAT, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+               "state": {key: state[key] for key in state}}
+    try:
+        with open(_sidecar_path(filepath, validate), 'wb') as f:
+            pickle.dump(payload, f, protocol=5)
+    except OSError as e:
+        logger.warning("No se pudo escribir la caché de configuración %s: %s", _sidecar_path(filepath, validate), e)
+
+def _parse_json(f) -> Dict:
+    """Parsea el JSON desde un mmap del fichero (sin copiarlo antes a un bytes) si hay orjson."""
+    if orjson is None:
+        return json.loads(f.read())
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError: # Un fichero vacío no se puede mapear
+        return orjson.loads(b"")
+    try:
+        with memoryview(mm) as buf:
+            return orjson.loads(buf)
+    finally:
+        mm.close()
+
+def _consume(records: List[Dict]):
+    """Recorre los registros crudos liberando cada uno en cuanto se ha convertido a modelo."""
+    records.reverse()
+    while records:
+        yield records.pop()
+
+def _copy_state(state: Mapping) -> Mapping:
+    """Copia el contenedor y sus listas; los modelos se comparten (nadie los modifica)."""
+    if isinstance(state, LazyConfig): # Ya devuelve listas nuevas en cada acceso
+        return state
+    return {k: (list(v) if isinstance(v, list) else dict(v) if isinstance(v, dict) else v)
+            for k, v in state.items()}
+
+def _state_from_schema(config: ConfigSchema) -> Dict:
+    """Convierte un ConfigSchema ya validado al diccionario de estado inicial."""
+    for product in config.products:
+        if product.type != FINISHED: # El BOM solo se conserva para productos terminados
+            product.bom = None
+    return {
+        "simulation_parameters": config.simulation_parameters,
+        "production_capacity": config.production_capacity_per_day,
+        "products": config.products,
+        "suppliers": config.suppliers,
+        "initial_inventory": config.initial_inventory
+    }
+
+def _build(model, validate: bool, **data):
+    """Instancia un modelo validando, o con model_construct (sin validar) si la configuración es de confianza."""
+    if validate or not hasattr(model, "model_construct"): # Los dataclasses de Pydantic siempre validan
+        return model(**data)
+    return model.model_construct(**data)
+
+def load_initial_config(filepath: str, validate: bool = False) -> Mapping:
     """
     Carga la configuración inicial desde un archivo JSON.
 
     Args:
         filepath: Ruta al archivo JSON de configuración.
+        validate: Si es True, valida todos los datos con Pydantic. Por defecto
+            se asume que el fichero es de confianza y los modelos se crean con
+            model_construct, sin coste de validación.
 
     Returns:
-        Un diccionario conteniendo las listas de productos, proveedores,
+        Un mapeo (dict o LazyConfig) con las listas de productos, proveedores,
         inventario inicial y parámetros de simulación.
         Ej: {'products': [...], 'suppliers': [...], 'initial_inventory': [...],
              'simulation_parameters': {...}, 'production_capacity': ...}
     """
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            config_data = json.load(f)
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        logger.error("Archivo de configuración no encontrado en %s", filepath)
+        return {}
+    # Misma ruta, fecha de modificación y tamaño: se reutiliza la carga anterior
+    key = (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size, validate)
+    if key not in _CONFIG_CACHE:
+        # Después de la caché en memoria, la caché binaria en disco; si no, parseo del JSON
+        initial_state = _load_sidecar(filepath, stat, validate)
+        if not initial_state:
+            initial_state = _parse_config(filepath, validate)
+            if not initial_state:
+                return {}
+            if isinstance(initial_state, LazyConfig):
+                # La caché en disco se escribe cuando se hayan construido todas las
+                # listas, sin forzar aquí la construcción de los modelos
+                initial_state.on_built(lambda state: _write_sidecar(filepath, stat, validate, state))
+            else:
+                _write_sidecar(filepath, stat, validate, initial_state)
+        # Descartar versiones anteriores del mismo fichero
+        for old_key in [k for k in _CONFIG_CACHE if k[0] == key[0] and k[3] == validate]:
+            del _CONFIG_CACHE[old_key]
+        _CONFIG_CACHE[key] = initial_state
+    return _copy_state(_CONFIG_CACHE[key])
+
+def _parse_config(filepath: str, validate: bool) -> Mapping:
+    """Lee, parsea y convierte el fichero de configuración (sin caché)."""
+    try:
+        # Lectura binaria: orjson decodifica UTF-8 directamente desde el buffer
+        with open(filepath, 'rb') as f:
+            config_data = _parse_json(f)
     except FileNotFoundError:
-        print(f"Error: Archivo de configuración no encontrado en {filepath}")
+        logger.error("Archivo de configuración no encontrado en %s", filepath)
         return {}
     except json.JSONDecodeError:
-        print(f"Error: El archivo de configuración {filepath} no es un JSON válido.")
+        logger.error("El archivo de configuración %s no es un JSON válido.", filepath)
         return {}
 
-    # Validar y convertir los datos usando Pydantic (opcional pero recomendado)
-    # Aquí simplemente extraemos, la validación ocurrirá si instancias los modelos
-    initial_state = {
-        "simulation_parameters": config_data.get("simulation_parameters", {}),
-        "production_capacity": config_data.get("production_capacity_per_day", 0),
-        "products": [],
-        "suppliers": [],
-        "initial_inventory": []
-    }
+    # Con validación, todo el documento se valida en una sola llamada
+    if validate:
+        try:
+            initial_state = _state_from_schema(_config_validator().validate_python(config_data))
+            logger.info("Configuración cargada desde %s", filepath)
+            return initial_state
+        except ValidationError:
+            pass # Algún elemento no es válido: se carga elemento a elemento descartando los erróneos
 
-    # Cargar productos
-    for prod_data in config_data.get("products", []):
-        bom_items = None
-        # Extraer el BOM del diccionario original ANTES de usar **prod_data
-        raw_bom_data = prod_data.pop("bom", None) # Usa pop para extraer y eliminar 'bom'
-
-        if raw_bom_data is not None and prod_data.get("type") == "finished": # Asegúrate que solo procesamos BOM para 'finished'
-            try:
-                bom_items = [BOMItem(**item) for item in raw_bom_data]
-            except Exception as e: # Captura errores si el formato del BOM es incorrecto
-                    print(f"Error processing BOM for product data: {prod_data.get('name', 'N/A')}: {e}")
-                    # Decide qué hacer: continuar sin BOM, registrar error, etc.
-                    # Por ahora, continuamos sin BOM para este producto si falla
-                    bom_items = None
+    logger.info("Configuración cargada desde %s", filepath)
+    # Los modelos se construyen (y validan, si se pide) en el primer acceso a cada lista
+    return LazyConfig(config_data, validate)
 
-        try:
-                # Ahora pasamos el 'bom' procesado explícitamente y el resto con **
-                product_instance = Product(bom=bom_items, **prod_data)
-                initial_state["products"].append(product_instance)
-        except Exception as e: # Captura errores de validación de Pydantic
-                print(f"Error creating Product instance for data: {prod_data.get('name', 'N/A')}: {e}")
-                # Decide si quieres detener la carga o solo saltar este producto
-    # Cargar proveedores
-    for supp_data in config_data.get("suppliers", []):
-         # Convertimos las keys del supply_details a int porque JSON las trata como string
-         details = supp_data.get("supply_details", {})
-         parsed_details = {int(k): tuple(v) for k, v in details.items()}
-         supp_data['supply_details'] = parsed_details # Reemplaza con el diccionario parseado
-         initial_state["suppliers"].append(Supplier(**supp_data))
-
-
-    # Cargar inventario inicial
-    for inv_data in config_data.get("initial_inventory", []):
-        initial_state["initial_inventory"].append(InventoryItem(**inv_data))
-
-    print(f"Configuración cargada desde {filepath}")
-    return initial_state
+def _bom(prod_data: Dict, validate: bool) -> Optional[List[BOMItem]]:
+    """Extrae (con pop) y convierte el BOM crudo de un producto; None si no aplica o es inválido."""
+    # Extraer el BOM del diccionario original ANTES de usar **prod_data
+    raw_bom_data = prod_data.pop("bom", None) # Usa pop para extraer y eliminar 'bom'
+    if raw_bom_data is None or prod_data.get("type") != FINISHED: # Solo procesamos BOM para 'finished'
+        return None
+    try:
+        if validate:
+            return _bom_validator().validate_python(raw_bom_data)
+        return [BOMItem._make(_bom_fields(item)) for item in raw_bom_data]
+    except Exception as e: # Captura errores si el formato del BOM es incorrecto
+        logger.error("Error processing BOM for product data: %s: %s", prod_data.get('name', 'N/A'), e)
+        # Por ahora, continuamos sin BOM para este producto si falla
+        return None
+
+def _product(prod_data: Dict, validate: bool) -> Optional[Product]:
+    """Crea un Product a partir de sus datos crudos; None (y error en el log) si no es válido."""
+    if not validate and isinstance(prod_data.get("type"), str):
+        prod_data["type"] = sys.intern(prod_data["type"]) # model_construct no pasa por el validador de Product
+    try:
+        # Pasamos el 'bom' procesado explícitamente y el resto con **
+        return _build(Product, validate, bom=_bom(prod_data, validate), **prod_data)
+    except Exception as e: # Captura errores de validación de Pydantic
+        logger.error("Error creating Product instance for data: %s: %s", prod_data.get('name', 'N/A'), e)
+        return None # Se salta este producto
+
+def _supplier_fields(supp_data: Dict, validate: bool) -> Dict:
+    """Prepara los datos crudos de un proveedor para construir el modelo."""
+    # JSON trata las keys del supply_details como string. Al validar, Pydantic
+    # las convierte a int (y las listas a tuplas) en pydantic-core; sin
+    # validación model_construct no convierte tipos y hay que hacerlo aquí
+    if not validate:
+        details = supp_data.get("supply_details", {})
+        supp_data['supply_details'] = dict(zip(map(int, details), map(tuple, details.values()))) # Iteración en C
+    return supp_data
+
+def _load_products(records: List[Dict], validate: bool) -> List[Product]:
+    """Convierte los productos crudos del JSON a modelos Product."""
+    # Las listas crudas se vacían mientras se recorren para que el documento
+    # parseado y los modelos no ocupen memoria a la vez
+    products = [_product(prod_data, validate) for prod_data in _consume(records)]
+    return [p for p in products if p is not None]
+
+def _load_suppliers(records: List[Dict], validate: bool) -> List[Supplier]:
+    """Convierte los proveedores crudos del JSON a modelos Supplier."""
+    return [_build(Supplier, validate, **_supplier_fields(supp_data, validate))
+            for supp_data in _consume(records)]
+
+def _load_inventory(records: List[Dict], validate: bool) -> List[InventoryItem]:
+    """Convierte el inventario inicial crudo del JSON a modelos InventoryItem."""
+    return [_build(InventoryItem, validate, **inv_data) for inv_data in _consume(records)]
+
+class LazyConfig(Mapping):
+    """
+    Configuración cargada cuyas listas de modelos se construyen bajo demanda.
+
+    simulation_parameters y production_capacity se resuelven al cargar (son
+    pequeños); products, suppliers e initial_inventory se convierten a modelos
+    en su primer acceso. Cada acceso devuelve una lista nueva, así que quien la
+    modifique no altera la configuración compartida.
+    """
+
+    _BUILDERS = {"products": _load_products,
+                 "suppliers": _load_suppliers,
+                 "initial_inventory": _load_inventory}
+
+    def __init__(self, config_data: Dict, validate: bool):
+        self._validate = validate
+        self._eager = {
+            "simulation_parameters": config_data.get("simulation_parameters", {}),
+            "production_capacity": config_data.get("production_capacity_per_day", 0),
+        }
+        self._raw = {key: config_data.get(key, []) for key in self._BUILDERS}
+        self._built: Dict[str, list] = {}
+        self._on_built = None
+
+    def on_built(self, callback):
+        """Registra callback(self), que se llama una vez cuando todas las listas están construidas."""
+        self._on_built = callback
+
+    def __getitem__(self, key: str):
+        if key in self._eager:
+            return self._eager[key]
+        if key not in self._BUILDERS:
+            raise KeyError(key)
+        if key not in self._built:
+            self._built[key] = self._BUILDERS[key](self._raw.pop(key), self._validate)
+            if self._on_built is not None and len(self._built) == len(self._BUILDERS):
+                callback, self._on_built = self._on_built, None
+                callback(self)
+        return list(self._built[key])
+
+    def __contains__(self, key) -> bool:
+        return key in self._eager or key in self._BUILDERS
+
+    def __iter__(self):
+        yield from self._eager
+        yield from self._BUILDERS
+
+    def __len__(self) -> int:
+        return len(self._eager) + len(self._BUILDERS)
+
+    @property
+    def products(self) -> List[Product]:
+        return self["products"]
+
+    @property
+    def suppliers(self) -> List[Supplier]:
+        return self["suppliers"]
+
+    @property
+    def initial_inventory(self) -> List[InventoryItem]:
+        return self["initial_inventory"]
 
 # Ejemplo de cómo usarlo (puedes borrar o comentar esto más tarde)
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     config = load_initial_config("config_initial.json")
     if config:
         print("\n--- Resumen Configuración ---")
@@ -1,23 +1,40 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Literal, Optional
+import sys
+import numpy as np
+from dataclasses import dataclass
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, field_validator
+from pydantic import dataclasses as pydantic_dataclasses
+from typing import List, Dict, Literal, NamedTuple, Optional, Tuple
 # models.py
 from typing import Literal
 ProductType = Literal["raw", "finished"]
 
 # Tipos de productos (basado en Sección 5)
 ProductType = Literal["raw", "finished"]
+# Constantes internadas para los tipos: todos los productos comparten el mismo
+# objeto str en lugar de una copia por instancia leída del JSON
+RAW = sys.intern("raw")
+FINISHED = sys.intern("finished")
 
 # Estados posibles para pedidos y órdenes (puedes añadir más)
 ProductionStatus = Literal["pendiente", "liberado", "en_progreso", "completado", "cancelado"]
 PurchaseStatus = Literal["emitida", "en_transito", "recibida", "cancelada"]
 
+# Todos los modelos usan defer_build=True: Pydantic construye su validador y
+# serializador en el primer uso en lugar de al importar este módulo.
+
+# Los objetos pequeños y numerosos (líneas de BOM, inventario, eventos) son
+# tuplas o dataclasses con __slots__: sin __dict__ por instancia ocupan varias veces menos.
+
 # Para representar un item en el Bill of Materials (BOM)
-class BOMItem(BaseModel):
+# NamedTuple: se construye en C con _make; Pydantic la valida (también desde
+# un dict) cuando forma parte de otro modelo
+class BOMItem(NamedTuple):
     material_id: int # ID del producto materia prima
     quantity: int
 
 # Modelo para Productos (materias primas o terminados) (basado en Sección 4 y 5)
 class Product(BaseModel):
+    model_config = ConfigDict(defer_build=True)
     id: int
     name: str
     type: ProductType
@@ -25,8 +42,14 @@ class Product(BaseModel):
     bom: Optional[List[BOMItem]] = None
     # Podrías añadir el tiempo de fabricación aquí si varía por producto
 
+    @field_validator("type")
+    @classmethod
+    def _intern_type(cls, value: str) -> str:
+        return sys.intern(value)
+
 # Modelo para Proveedores (basado en Sección 4 y 5)
 class Supplier(BaseModel):
+    model_config = ConfigDict(defer_build=True)
     id: int
     name: str
     # Qué productos vende este proveedor (lista de IDs de producto)
@@ -40,15 +63,38 @@ class Supplier(BaseModel):
     lead_time: Optional[int] = None # Días (simple)
     # Estructura más flexible:
     supply_details: Dict[int, tuple[float, int]] = Field(default_factory=dict) # {prod_id: (cost, lead_time_days)}
+    # supply_details en arrays paralelos ordenados por product_id (se crean en el primer uso)
+    _supply_arrays: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = PrivateAttr(default=None)
+
+    def supply_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Devuelve (product_ids, unit_costs, lead_times) ordenados por product_id.
+
+        Es una instantánea de solo lectura tomada en la primera llamada: no
+        refleja cambios posteriores en supply_details.
+        """
+        if self._supply_arrays is None:
+            n = len(self.supply_details)
+            ids = np.fromiter(self.supply_details.keys(), dtype=np.int64, count=n)
+            costs = np.fromiter((v[0] for v in self.supply_details.values()), dtype=np.float64, count=n)
+            lead_times = np.fromiter((v[1] for v in self.supply_details.values()), dtype=np.int64, count=n)
+            order = np.argsort(ids, kind="stable")
+            arrays = (ids[order], costs[order], lead_times[order])
+            for arr in arrays:
+                arr.flags.writeable = False
+            self._supply_arrays = arrays
+        return self._supply_arrays
 
 
 # Modelo para Items en Inventario (basado en Sección 4 y 5)
-class InventoryItem(BaseModel):
+@pydantic_dataclasses.dataclass(slots=True, config=ConfigDict(defer_build=True))
+class InventoryItem:
     product_id: int
     quantity: int = Field(ge=0) # Cantidad no puede ser negativa
 
 # Modelo para Pedidos de Fabricación (PedidoFab) (basado en Sección 4)
 class ProductionOrder(BaseModel):
+    model_config = ConfigDict(defer_build=True)
     id: int
     creation_date: int # Día de creación (simulado)
     product_id: int   # ID del producto terminado a fabricar
@@ -57,6 +103,7 @@ class ProductionOrder(BaseModel):
 
 # Modelo para Órdenes de Compra (OrdenCompra) (basado en Sección 4)
 class PurchaseOrder(BaseModel):
+    model_config = ConfigDict(defer_build=True)
     id: int
     supplier_id: int
     product_id: int # ID del producto materia prima comprado
@@ -67,9 +114,21 @@ class PurchaseOrder(BaseModel):
     status: PurchaseStatus = "emitida"
 
 # Modelo para Eventos (basado en Sección 4)
-class Event(BaseModel):
+# Dataclass sin validación: los eventos los crea la propia simulación
+@dataclass(slots=True)
+class Event:
     id: int
     type: str # Ej: "DEMANDA_GENERADA", "PRODUCCION_INICIADA", "COMPRA_RECIBIDA"
     sim_day: int # Día de la simulación en que ocurrió
     details: Dict # Un diccionario con detalles específicos del evento
-    
\ No newline at end of file
+    
+
+# Esquema del fichero de configuración completo: permite parsear y validar
+# todo el JSON en una sola llamada (pydantic-core) en lugar de objeto a objeto
+class ConfigSchema(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+    simulation_parameters: Dict = Field(default_factory=dict)
+    production_capacity_per_day: int = 0
+    products: List[Product] = Field(default_factory=list)
+    suppliers: List[Supplier] = Field(default_factory=list)
+    initial_inventory: List[InventoryItem] = Field(default_factory=list)
@@ -1,15 +1,79 @@
 import simpy
-import random
 import json
-from typing import Dict, List, Optional, Tuple
+from array import array
+import numpy as np
+import pandas as pd
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Tuple, Union
+try:
+    from numba import njit # Compilación JIT de los kernels de BOM (opcional)
+except ImportError:
+    njit = None
 
 # Importa tus modelos y el cargador de configuración
 from models import (
     Product, Supplier, InventoryItem, ProductionOrder, PurchaseOrder,
-    Event, BOMItem, ProductType, ProductionStatus, PurchaseStatus
+    Event, BOMItem, ProductType, ProductionStatus, PurchaseStatus, RAW, FINISHED
 )
 from config_loader import load_initial_config
 
+def _accumulate_needs(order_qty: np.ndarray, order_prod_idx: np.ndarray, bom_offsets: np.ndarray,
+                      bom_mats: np.ndarray, bom_unit_qty: np.ndarray, out: np.ndarray):
+    """
+    Suma en `out` las necesidades de material de un lote de pedidos.
+
+    Los BOMs están en formato CSR: las líneas del producto con índice p ocupan
+    bom_offsets[p]:bom_offsets[p + 1] en bom_mats / bom_unit_qty.
+    """
+    starts = bom_offsets[order_prod_idx]
+    counts = bom_offsets[order_prod_idx + 1] - starts
+    # Posición plana de cada línea de BOM de cada pedido
+    first_row = np.cumsum(counts) - counts
+    rows = np.repeat(starts - first_row, counts) + np.arange(counts.sum())
+    np.add.at(out, bom_mats[rows], bom_unit_qty[rows] * np.repeat(order_qty, counts))
+
+def _accumulate_needs_loop(order_qty: np.ndarray, order_prod_idx: np.ndarray, bom_offsets: np.ndarray,
+                           bom_mats: np.ndarray, bom_unit_qty: np.ndarray, out: np.ndarray):
+    """Mismo cálculo que _accumulate_needs como bucles simples, para compilarlo con Numba."""
+    for i in range(order_prod_idx.size):
+        p = order_prod_idx[i]
+        q = order_qty[i]
+        for k in range(bom_offsets[p], bom_offsets[p + 1]):
+            out[bom_mats[k]] += bom_unit_qty[k] * q
+
+if njit is not None:
+    _accumulate_needs = njit(cache=True)(_accumulate_needs_loop)
+
+# Eventos frecuentes cuyos detalles se registran como tupla; se convierten a
+# dict con estas claves al materializar self.events
+_EVENT_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "INVENTORY_INCREASE": ("product_id", "quantity", "new_level"),
+    "INVENTORY_DECREASE": ("product_id", "quantity", "new_level"),
+}
+
+def _skip_event(event_type: str, details: Union[Dict, Tuple]):
+    """Sustituye a log_event cuando el registro de eventos está desactivado."""
+
+class InventoryView(Mapping):
+    """Vista de solo lectura {product_id: cantidad} sobre el array de inventario."""
+
+    def __init__(self, pid_index: Dict[int, int], array: np.ndarray):
+        self._pid_index = pid_index
+        self._array = array
+
+    def __getitem__(self, product_id: int) -> int:
+        return int(self._array[self._pid_index[product_id]])
+
+    def __iter__(self):
+        return iter(self._pid_index)
+
+    def __len__(self) -> int:
+        return len(self._pid_index)
+
+    def to_dict(self) -> Dict[int, int]:
+        """Copia {product_id: cantidad} para serializar (p. ej. al final del día)."""
+        return dict(zip(self._pid_index, self._array[list(self._pid_index.values())].tolist()))
+
 class SimulationEnvironment:
     def __init__(self, config_filepath: str):
         print("Initializing Simulation Environment...")
@@ -21,8 +85,25 @@ class SimulationEnvironment:
         self.config = config
         self.params = config['simulation_parameters']
         self.sim_start_day = 0 # O leerlo de config si se añade
+        # Día en curso; el tiempo solo avanza con run_day, que ejecuta el entorno de
+        # current_day a current_day + 1, así que coincide con int(env.now) en todos
+        # los procesos y eventos (se usa en su lugar)
         self.current_day = self.sim_start_day
 
+        # Con log_events=False no se registran eventos ni se imprime la traza diaria
+        # (simulaciones largas sin interfaz)
+        self.log_events = bool(self.params.get("log_events", True))
+        if not self.log_events:
+            self.log_event = _skip_event
+
+        # Generador aleatorio de NumPy (la demanda se muestrea por lotes)
+        self._rng = np.random.default_rng(self.params.get("random_seed"))
+        # Tiempo (en días) que se retiene la capacidad tras consumir los materiales
+        self._prod_step_time = self.params.get("production_step_time", 0)
+        # Parámetros de la demanda (normal), leídos una sola vez
+        self._demand_mean = self.params.get("demand_mean", 5)
+        self._demand_sigma = max(0, self.params.get("demand_variance", 2)) ** 0.5
+
         # Inicializar SimPy
         self.env = simpy.Environment(initial_time=self.sim_start_day)
 
@@ -43,40 +124,125 @@ class SimulationEnvironment:
         self.next_event_id = 1
 
         # Iniciar procesos principales (si los hay que corran siempre)
-        # self.env.process(self.some_continuous_process())
+        # Cola de pedidos listos para fabricar, atendida por un despachador por
+        # unidad de capacidad (en lugar de un proceso SimPy por pedido)
+        self.production_queue = simpy.Store(self.env)
+        for _ in range(self.production_capacity.capacity):
+            self.env.process(self.production_dispatcher())
         print("Simulation Environment Initialized.")
 
     def _load_master_data(self, config):
         """Carga productos y proveedores en diccionarios para acceso rápido."""
         self.products: Dict[int, Product] = {p.id: p for p in config['products']}
         self.suppliers: Dict[int, Supplier] = {s.id: s for s in config['suppliers']}
+        # Índice inverso {product_id: [(supplier_id, costo, lead_time), ...]}
+        self.product_to_suppliers: Dict[int, List[Tuple[int, float, int]]] = {}
+        for sup_id, supplier in self.suppliers.items():
+            for prod_id, (cost, lead_time) in supplier.supply_details.items():
+                self.product_to_suppliers.setdefault(prod_id, []).append((sup_id, cost, lead_time))
+        # BOM de cada producto terminado; get_bom es una sola búsqueda en este dict
+        self._bom_cache: Dict[int, Optional[List[BOMItem]]] = {
+            pid: p.bom for pid, p in self.products.items() if p.type == FINISHED
+        }
+        self._build_bom_csr()
+        # IDs de los productos terminados, en el orden en que se genera su demanda
+        self._finished_ids = np.fromiter(self._bom_cache, dtype=np.int64, count=len(self._bom_cache))
         print(f"Loaded {len(self.products)} products and {len(self.suppliers)} suppliers.")
 
+    def _build_bom_csr(self):
+        """Aplana los BOMs en arrays CSR indexados por un índice compacto de producto."""
+        # product_ids[i] es el ID del producto con índice compacto i
+        self.product_ids = np.fromiter(self.products, dtype=np.int64, count=len(self.products))
+        self._pid_index: Dict[int, int] = {pid: i for i, pid in enumerate(self.products)}
+        offsets, mats, unit_qty = [0], [], []
+        self._incomplete_boms = set() # Productos con materiales desconocidos en su BOM
+        for product in self.products.values():
+            if product.type == FINISHED and product.bom:
+                for item in product.bom:
+                    if item.material_id not in self._pid_index:
+                        print(f"Warning: BOM of product {product.id} references unknown material {item.material_id}.")
+                        self._incomplete_boms.add(product.id)
+                        continue
+                    mats.append(self._pid_index[item.material_id])
+                    unit_qty.append(item.quantity)
+            offsets.append(len(mats))
+        self._bom_offsets = np.array(offsets, dtype=np.int64)
+        self._bom_mats = np.array(mats, dtype=np.int64)
+        self._bom_unit_qty = np.array(unit_qty, dtype=np.int64)
+
+        # BOM de cada producto terminado como arrays paralelos (vistas sobre el CSR):
+        # posiciones compactas de los materiales, sus IDs y la cantidad por unidad
+        self._bom_pos: Dict[int, np.ndarray] = {}
+        self.bom_mats: Dict[int, np.ndarray] = {}
+        self.bom_qty: Dict[int, np.ndarray] = {}
+        for i, (pid, product) in enumerate(self.products.items()):
+            if product.type == FINISHED and product.bom:
+                start, end = offsets[i], offsets[i + 1]
+                self._bom_pos[pid] = self._bom_mats[start:end]
+                self.bom_mats[pid] = self.product_ids[self._bom_mats[start:end]]
+                self.bom_qty[pid] = self._bom_unit_qty[start:end]
+
     def _initialize_state(self, config):
         """Inicializa inventario, listas de pedidos y eventos."""
-        self.inventory: Dict[int, int] = {item.product_id: item.quantity for item in config['initial_inventory']}
-        # Asegurarse que todos los productos (incluyendo materias primas sin stock inicial) estén en el inventario con 0
-        for prod_id in self.products:
-            if prod_id not in self.inventory:
-                 self.inventory[prod_id] = 0
-
-        self.production_orders: List[ProductionOrder] = []
+        # Stock indexado por el índice compacto de producto (alineado con self.product_ids);
+        # los productos sin stock inicial empiezan en 0. Una sola pasada sobre el
+        # inventario inicial y todo producto tiene posición: check_stock/add_stock/
+        # remove_stock indexan sin valor por defecto
+        self.inventory_array = np.zeros(len(self.product_ids), dtype=np.int64)
+        for item in config['initial_inventory']:
+            idx = self._pid_index.get(item.product_id)
+            if idx is None:
+                print(f"Warning: Initial inventory references unknown product {item.product_id}. Ignored.")
+                continue
+            self.inventory_array[idx] = item.quantity
+        self._inventory_view = InventoryView(self._pid_index, self.inventory_array)
+
+        self.production_orders_by_id: Dict[int, ProductionOrder] = {} # Todos los pedidos por ID (en orden de creación)
+        # Los recorridos frecuentes solo tocan los pedidos abiertos; los terminados
+        # (completados o cancelados) pasan a completed_orders y ya no cambian
+        self.active_orders: Dict[int, ProductionOrder] = {}
+        self.completed_orders: List[ProductionOrder] = []
+        self.released_orders: set = set() # IDs de pedidos liberados aún sin proceso de producción lanzado
         self.purchase_orders: List[PurchaseOrder] = []
-        self.events: List[Event] = []
+        # Registro de eventos en columnas paralelas (solo se añade); los objetos
+        # Event se construyen al leer self.events
+        self._event_ids: List[int] = []
+        self._event_types: List[str] = []
+        self._event_days = array('i')
+        self._event_details: List[Union[Dict, Tuple]] = []
+        self._events: List[Event] = [] # Eventos ya materializados (prefijo de las columnas)
+        # Se incrementa cada vez que cambia el estado visible (pedidos, compras, inventario)
+        self.state_version = 0
+        # Vistas columnares de los pedidos; la de abiertos se reconstruye solo si
+        # hubo cambios y la de terminados solo crece con los nuevos cierres
+        self._active_orders_df = self._orders_frame([])
+        self._closed_orders_df = self._orders_frame([])
+        self._orders_df: Optional[pd.DataFrame] = None
+        self._orders_by_status: Optional[Dict[str, pd.DataFrame]] = None
+        self._orders_dirty = True
         print(f"Initial inventory set for {len(self.inventory)} product IDs.")
 
 
-    def log_event(self, event_type: str, details: Dict):
-        """Registra un evento en la simulación."""
-        event = Event(
-            id=self.next_event_id,
-            type=event_type,
-            sim_day=int(self.env.now), # Día actual
-            details=details
-        )
-        self.events.append(event)
+    def log_event(self, event_type: str, details: Union[Dict, Tuple]):
+        """Registra un evento en la simulación (details: dict, o tupla si el tipo está en _EVENT_FIELDS)."""
+        self._event_ids.append(self.next_event_id)
+        self._event_types.append(event_type)
+        self._event_days.append(self.current_day) # Día actual
+        self._event_details.append(details)
         self.next_event_id += 1
-        # print(f"Day {int(self.env.now)}: EVENT - {event_type} - {details}") # Debug
+        # print(f"Day {self.current_day}: EVENT - {event_type} - {details}") # Debug
+
+    @property
+    def events(self) -> List[Event]:
+        """Eventos registrados como objetos Event (se materializan solo los nuevos)."""
+        done = len(self._events)
+        if done < len(self._event_ids):
+            types = self._event_types[done:]
+            details = [d if isinstance(d, dict) else dict(zip(_EVENT_FIELDS[t], d))
+                       for t, d in zip(types, self._event_details[done:])]
+            self._events.extend(map(Event, self._event_ids[done:], types,
+                                    self._event_days[done:].tolist(), details))
+        return self._events
 
     # --- Funciones de Acceso a Datos ---
     def get_product(self, product_id: int) -> Optional[Product]:
@@ -86,142 +252,264 @@ class SimulationEnvironment:
         return self.suppliers.get(supplier_id)
 
     def get_bom(self, product_id: int) -> Optional[List[BOMItem]]:
-        product = self.get_product(product_id)
-        return product.bom if product and product.type == "finished" else None
+        return self._bom_cache.get(product_id)
 
     def get_supplier_details_for_product(self, product_id: int) -> List[Tuple[int, float, int]]:
         """Encuentra qué proveedores venden un producto y sus detalles (costo, lead_time)."""
-        details = []
-        for sup_id, supplier in self.suppliers.items():
-            if product_id in supplier.supply_details:
-                cost, lead_time = supplier.supply_details[product_id]
-                details.append((sup_id, cost, lead_time))
-        return details
-
+        return list(self.product_to_suppliers.get(product_id, []))
+
+
+    @property
+    def inventory(self) -> Mapping:
+        """Inventario como mapeo {product_id: cantidad} (solo lectura)."""
+        return self._inventory_view
+
+    def inventory_get(self, product_id: int) -> int:
+        """Stock actual de un producto (0 si no existe)."""
+        idx = self._pid_index.get(product_id)
+        return int(self.inventory_array[idx]) if idx is not None else 0
+
+    def stock_of(self, product_ids) -> np.ndarray:
+        """Stock actual de varios productos en una sola indexación (0 para IDs desconocidos)."""
+        idx = np.fromiter((self._pid_index.get(pid, -1) for pid in product_ids), dtype=np.int64)
+        return np.where(idx >= 0, self.inventory_array[idx], 0)
+
+    @property
+    def production_orders(self) -> List[ProductionOrder]:
+        """Todos los pedidos de fabricación (abiertos y terminados) en orden de creación."""
+        return list(self.production_orders_by_id.values())
+
+    @staticmethod
+    def _orders_frame(orders) -> pd.DataFrame:
+        n = len(orders)
+        return pd.DataFrame({
+            "id": np.fromiter((o.id for o in orders), dtype=np.int64, count=n),
+            "product_id": np.fromiter((o.product_id for o in orders), dtype=np.int64, count=n),
+            "quantity": np.fromiter((o.quantity for o in orders), dtype=np.int64, count=n),
+            "status": [o.status for o in orders],
+            "creation_date": np.fromiter((o.creation_date for o in orders), dtype=np.int64, count=n),
+        })
+
+    def _refresh_orders_frames(self):
+        """Reconstruye la vista de pedidos abiertos y añade los recién terminados."""
+        if not self._orders_dirty:
+            return
+        self._active_orders_df = self._orders_frame(list(self.active_orders.values()))
+        n_closed = len(self._closed_orders_df)
+        if len(self.completed_orders) > n_closed:
+            self._closed_orders_df = pd.concat(
+                [self._closed_orders_df, self._orders_frame(self.completed_orders[n_closed:])],
+                ignore_index=True)
+        self._orders_df = None
+        self._orders_by_status = None
+        self._orders_dirty = False
+
+    @property
+    def active_orders_df(self) -> pd.DataFrame:
+        """
+        Vista columnar de los pedidos abiertos (pendientes, liberados o en progreso).
+
+        Columnas: id, product_id, quantity, status, creation_date. Se reconstruye
+        de forma perezosa cuando algún pedido cambió desde la última consulta.
+        """
+        self._refresh_orders_frames()
+        return self._active_orders_df
+
+    def orders_with_status(self, *statuses: str) -> pd.DataFrame:
+        """
+        Filas de active_orders_df con alguno de los estados dados, en orden de ID.
+
+        Los pedidos abiertos se reparten por estado en una sola pasada (groupby)
+        tras cada reconstrucción; cada consulta solo une los grupos pedidos.
+        """
+        self._refresh_orders_frames()
+        # Se trabaja sobre referencias locales: el atributo puede reiniciarse entre medias
+        active_df, by_status = self._active_orders_df, self._orders_by_status
+        if by_status is None:
+            by_status = self._orders_by_status = dict(tuple(active_df.groupby("status", sort=False)))
+        groups = [by_status[status] for status in statuses if status in by_status]
+        if not groups:
+            return active_df.iloc[:0]
+        return groups[0] if len(groups) == 1 else pd.concat(groups).sort_index()
+
+    @property
+    def orders_df(self) -> pd.DataFrame:
+        """Vista columnar de todos los pedidos (mismas columnas que active_orders_df), por ID."""
+        self._refresh_orders_frames()
+        if self._orders_df is None:
+            self._orders_df = pd.concat([self._closed_orders_df, self._active_orders_df],
+                                        ignore_index=True).sort_values("id", kind="stable", ignore_index=True)
+        return self._orders_df
+
+    def _close_order(self, order: ProductionOrder):
+        """Pasa un pedido completado o cancelado de active_orders a completed_orders."""
+        self.active_orders.pop(order.id, None)
+        self.completed_orders.append(order)
 
     # --- Funciones de Manipulación de Estado ---
     def check_stock(self, product_id: int, quantity: int) -> bool:
         """Verifica si hay suficiente stock."""
-        return self.inventory.get(product_id, 0) >= quantity
+        # Todo producto conocido tiene posición en el array: indexado directo
+        try:
+            return bool(self.inventory_array[self._pid_index[product_id]] >= quantity)
+        except KeyError: # Producto desconocido: stock 0
+            return quantity <= 0
 
     def check_bom_stock(self, product_id: int, quantity: int) -> bool:
         """Verifica si hay stock para todos los materiales del BOM para una cantidad dada."""
-        bom = self.get_bom(product_id)
-        if not bom:
+        bom_pos = self._bom_pos.get(product_id)
+        if bom_pos is None:
             print(f"Warning: No BOM found for product {product_id}")
             return False
-        for item in bom:
-            required = item.quantity * quantity
-            if not self.check_stock(item.material_id, required):
-                # print(f"Stock check failed for BOM of {product_id}: Need {required} of {item.material_id}, have {self.inventory.get(item.material_id, 0)}")
-                return False
-        return True
+        if product_id in self._incomplete_boms: # Un material desconocido nunca tiene stock
+            return False
+        # Stock de todos los materiales del BOM en una sola indexación
+        return bool((self.inventory_array[bom_pos] >= self.bom_qty[product_id] * quantity).all())
 
     def add_stock(self, product_id: int, quantity: int):
         """Añade stock al inventario."""
         if quantity < 0: return # No añadir negativo
-        self.inventory[product_id] = self.inventory.get(product_id, 0) + quantity
-        self.log_event("INVENTORY_INCREASE", {"product_id": product_id, "quantity": quantity, "new_level": self.inventory[product_id]})
+        try:
+            idx = self._pid_index[product_id]
+        except KeyError:
+            print(f"Error: Attempted to add stock of unknown product {product_id}.")
+            return
+        new_level = int(self.inventory_array[idx]) + quantity
+        self.inventory_array[idx] = new_level
+        self.log_event("INVENTORY_INCREASE", (product_id, quantity, new_level))
 
     def remove_stock(self, product_id: int, quantity: int):
         """Quita stock del inventario. Asume que check_stock fue llamado antes."""
         if quantity < 0: return # No quitar negativo
-        current_stock = self.inventory.get(product_id, 0)
+        try:
+            idx = self._pid_index[product_id]
+        except KeyError:
+            print(f"Error: Attempted to remove {quantity} of {product_id}, but only 0 available.")
+            return
+        current_stock = int(self.inventory_array[idx])
         if current_stock >= quantity:
-            self.inventory[product_id] = current_stock - quantity
-            self.log_event("INVENTORY_DECREASE", {"product_id": product_id, "quantity": quantity, "new_level": self.inventory[product_id]})
+            self.inventory_array[idx] = current_stock - quantity
+            self.log_event("INVENTORY_DECREASE", (product_id, quantity, current_stock - quantity))
         else:
             print(f"Error: Attempted to remove {quantity} of {product_id}, but only {current_stock} available.")
             # Podrías levantar una excepción aquí
 
+    def consume_bom_materials(self, product_id: int, quantity: int):
+        """Descuenta de una vez los materiales del BOM. Asume que check_bom_stock fue llamado antes."""
+        pos = self._bom_pos[product_id]
+        needed = self.bom_qty[product_id] * quantity
+        np.subtract.at(self.inventory_array, pos, needed)
+        for material_id, qty, level in zip(self.bom_mats[product_id].tolist(), needed.tolist(),
+                                           self.inventory_array[pos].tolist()):
+            self.log_event("INVENTORY_DECREASE", (material_id, qty, level))
+
     # --- Procesos de SimPy ---
 
     def daily_demand_generator(self):
         """Proceso SimPy que genera demanda cada día."""
+        # Alias locales: evitan buscar atributos en cada iteración
+        env = self.env
+        timeout = env.timeout
+        log = self.log_event
+        active, orders_by_id = self.active_orders, self.production_orders_by_id
+        normal = self._rng.normal
+        mean, sigma = self._demand_mean, self._demand_sigma
+        finished_ids = self._finished_ids.tolist()
+        n_finished = len(finished_ids)
+        # Como mucho un pedido por producto y día: la demanda del día se agrega.
+        # Sin varianza la demanda es la media (no hace falta muestrear)
+        fixed_quantities = np.full(n_finished, max(0, int(np.rint(mean))), dtype=np.int64) if sigma == 0 else None
         while True:
-            day = int(self.env.now)
-            # Generar demanda para productos terminados
-            for prod_id, product in self.products.items():
-                if product.type == "finished":
-                    # Usar media y varianza de los parámetros
-                    mean = self.params.get("demand_mean", 5)
-                    variance = self.params.get("demand_variance", 2)
-                    # Generar demanda (usar normal, asegurar >= 0)
-                    # random.gauss puede dar negativos, clamp a 0
-                    quantity_demanded = max(0, round(random.gauss(mean, variance**0.5)))
-
-                    if quantity_demanded > 0:
-                        new_order = ProductionOrder(
-                            id=self.next_production_order_id,
-                            creation_date=day,
-                            product_id=prod_id,
-                            quantity=quantity_demanded,
-                            status="pendiente" # Estado inicial
-                        )
-                        self.production_orders.append(new_order)
-                        self.next_production_order_id += 1
-                        self.log_event("DEMAND_GENERATED", {"order_id": new_order.id, "product_id": prod_id, "quantity": quantity_demanded})
+            day = self.current_day
+            if fixed_quantities is not None:
+                quantities = fixed_quantities
+            else:
+                # Demanda de todos los productos terminados en una sola llamada;
+                # la normal puede dar negativos, clamp a 0
+                quantities = np.maximum(0, np.rint(normal(mean, sigma, size=n_finished))).astype(np.int64)
+            order_id = self.next_production_order_id
+            for prod_id, quantity_demanded in zip(finished_ids, quantities.tolist()):
+                if quantity_demanded > 0:
+                    new_order = ProductionOrder(
+                        id=order_id,
+                        creation_date=day,
+                        product_id=prod_id,
+                        quantity=quantity_demanded,
+                        status="pendiente" # Estado inicial
+                    )
+                    orders_by_id[order_id] = new_order
+                    active[order_id] = new_order
+                    log("DEMAND_GENERATED", {"order_id": order_id, "product_id": prod_id, "quantity": quantity_demanded})
+                    order_id += 1
+            self.next_production_order_id = order_id
 
             # Esperar hasta el próximo día
-            yield self.env.timeout(1)
+            yield timeout(1)
 
     def production_process(self, order: ProductionOrder):
-        """Proceso SimPy para fabricar un pedido de producción."""
-        print(f"Day {int(self.env.now)}: Attempting production for Order {order.id} ({order.quantity}x{order.product_id})")
-        bom = self.get_bom(order.product_id)
+        """Fabrica un pedido de producción (lo ejecuta production_dispatcher)."""
+        # Alias locales de los atributos usados varias veces
+        env, log, trace = self.env, self.log_event, self.log_events
+        order_id, product_id, quantity = order.id, order.product_id, order.quantity
+        if trace: print(f"Day {self.current_day}: Attempting production for Order {order_id} ({quantity}x{product_id})")
+        bom = self.get_bom(product_id)
         if not bom:
-            print(f"Error: Cannot produce Order {order.id}, no BOM found for {order.product_id}.")
+            print(f"Error: Cannot produce Order {order_id}, no BOM found for {product_id}.")
             order.status = "cancelado" # O algún estado de error
-            self.log_event("PRODUCTION_ERROR", {"order_id": order.id, "reason": "No BOM"})
+            self._close_order(order)
+            log("PRODUCTION_ERROR", {"order_id": order_id, "reason": "No BOM"})
             return # Termina el proceso para esta orden
 
-        # --- Adquisición de Capacidad ---
-        # Este bloque 'with' solicita el recurso. Si no está disponible,
-        # el proceso se pausa aquí hasta que lo esté.
-        with self.production_capacity.request() as req:
-            yield req # Espera a que se conceda la capacidad
-            print(f"Day {int(self.env.now)}: Capacity granted for Order {order.id}. Verifying materials again.")
-
-            # --- Doble chequeo de materiales (CRÍTICO por concurrencia) ---
-            materials_still_available = True
-            required_materials = {}
-            for item in bom:
-                required = item.quantity * order.quantity
-                required_materials[item.material_id] = required
-                if not self.check_stock(item.material_id, required):
-                    materials_still_available = False
-                    break # Salir del bucle for si falta algo
-
-            if materials_still_available:
-                print(f"Day {int(self.env.now)}: Materials confirmed for Order {order.id}. Starting production.")
-                order.status = "en_progreso"
-                self.log_event("PRODUCTION_STARTED", {"order_id": order.id})
-
-                # --- Consumo de materiales ---
-                for material_id, qty_needed in required_materials.items():
-                    self.remove_stock(material_id, qty_needed)
-
-                # --- Simulación del tiempo de producción ---
-                # En este modelo, la adquisición de capacidad representa el tiempo.
-                # Si 1 unidad de capacidad = 1 unidad de producto/día, ya está modelado.
-                # Podríamos añadir un timeout pequeño si fuera necesario modelar un tiempo *después* de consumir materiales.
-                yield self.env.timeout(0.001) # Pequeña espera simbólica
-
-                # --- Finalización ---
-                self.add_stock(order.product_id, order.quantity) # Añadir producto terminado
-                order.status = "completado"
-                print(f"Day {int(self.env.now)}: Production completed for Order {order.id}.")
-                self.log_event("PRODUCTION_COMPLETED", {"order_id": order.id})
+        # --- Capacidad ---
+        # Hay exactamente un despachador por unidad de capacidad y cada uno fabrica
+        # un pedido a la vez, así que ejecutar este cuerpo ya equivale a tener la
+        # capacidad: no se pide production_capacity (sería un evento SimPy extra por pedido)
+        if trace: print(f"Day {self.current_day}: Capacity granted for Order {order_id}. Verifying materials again.")
+
+        # --- Doble chequeo de materiales (CRÍTICO por concurrencia) ---
+        # Un solo gather sobre el array de inventario en lugar de un check_stock por línea
+        materials_still_available = self.check_bom_stock(product_id, quantity)
+
+        if materials_still_available:
+            if trace: print(f"Day {self.current_day}: Materials confirmed for Order {order_id}. Starting production.")
+            order.status = "en_progreso"
+            log("PRODUCTION_STARTED", {"order_id": order_id})
+
+            # --- Consumo de materiales ---
+            self.consume_bom_materials(product_id, quantity)
+
+            # --- Simulación del tiempo de producción ---
+            # En este modelo, la adquisición de capacidad representa el tiempo.
+            # Si 1 unidad de capacidad = 1 unidad de producto/día, ya está modelado.
+            # Si hace falta modelar un tiempo *después* de consumir materiales se
+            # configura con production_step_time; por defecto 0 (sin evento extra)
+            if self._prod_step_time:
+                yield env.timeout(self._prod_step_time)
+
+            # --- Finalización ---
+            self.add_stock(product_id, quantity) # Añadir producto terminado
+            order.status = "completado"
+            self._close_order(order)
+            if trace: print(f"Day {self.current_day}: Production completed for Order {order_id}.")
+            log("PRODUCTION_COMPLETED", {"order_id": order_id})
 
-            else:
-                # Los materiales fueron consumidos por otro proceso mientras esperaba capacidad
-                print(f"Day {int(self.env.now)}: Materials no longer available for Order {order.id} after waiting for capacity. Releasing capacity.")
-                order.status = "liberado" # Volver a estado liberado para reintentar? O pendiente_material?
-                self.log_event("PRODUCTION_HALTED", {"order_id": order.id, "reason": "Materials unavailable after wait"})
-                # La capacidad se libera automáticamente al salir del 'with'
+        else:
+            # Los materiales fueron consumidos por otro pedido mientras esperaba en la cola
+            if trace: print(f"Day {self.current_day}: Materials no longer available for Order {order_id} after waiting in the queue.")
+            order.status = "liberado" # Volver a estado liberado para reintentar? O pendiente_material?
+            self.released_orders.add(order_id)
+            log("PRODUCTION_HALTED", {"order_id": order_id, "reason": "Materials unavailable after wait"})
+
+    def production_dispatcher(self):
+        """Proceso SimPy de larga duración: toma pedidos de production_queue y los fabrica."""
+        get, produce = self.production_queue.get, self.production_process
+        while True:
+            order = yield get()
+            yield from produce(order)
 
     def purchase_tracking_process(self, purchase_order: PurchaseOrder):
         """Proceso SimPy que sigue una orden de compra hasta su llegada."""
+        env = self.env
         supplier = self.get_supplier(purchase_order.supplier_id)
         prod_details = supplier.supply_details.get(purchase_order.product_id) if supplier else None
 
@@ -233,38 +521,61 @@ class SimulationEnvironment:
 
         cost, lead_time = prod_details
         purchase_order.estimated_delivery_date = purchase_order.emission_date + lead_time
-        print(f"Day {int(self.env.now)}: Tracking Purchase Order {purchase_order.id} (Product {purchase_order.product_id}). Est. Delivery: Day {purchase_order.estimated_delivery_date}")
+        if self.log_events: print(f"Day {self.current_day}: Tracking Purchase Order {purchase_order.id} (Product {purchase_order.product_id}). Est. Delivery: Day {purchase_order.estimated_delivery_date}")
         purchase_order.status = "en_transito"
 
         # Esperar el tiempo de entrega
-        yield self.env.timeout(lead_time)
+        yield env.timeout(lead_time)
 
         # Llegada
-        arrival_day = int(self.env.now)
+        arrival_day = self.current_day
         purchase_order.actual_delivery_date = arrival_day
         purchase_order.status = "recibida"
         self.add_stock(purchase_order.product_id, purchase_order.quantity)
-        print(f"Day {arrival_day}: Purchase Order {purchase_order.id} received.")
+        if self.log_events: print(f"Day {arrival_day}: Purchase Order {purchase_order.id} received.")
         self.log_event("PURCHASE_RECEIVED", {"po_id": purchase_order.id, "product_id": purchase_order.product_id, "quantity": purchase_order.quantity})
 
 
     # --- Control de la Simulación ---
 
     def check_and_start_production(self):
-         """Revisa pedidos liberados y si hay material, inicia el proceso SimPy."""
-         # Iterar sobre una copia para poder modificar la lista original si fuera necesario
-         for order in list(self.production_orders):
-             if order.status == "liberado":
-                 print(f"Day {int(self.env.now)}: Checking materials for released Order {order.id} ({order.quantity}x{order.product_id})")
-                 if self.check_bom_stock(order.product_id, order.quantity):
-                     print(f"Day {int(self.env.now)}: Materials OK for Order {order.id}. Launching production process.")
-                     # Iniciar el proceso SimPy para esta orden
-                     self.env.process(self.production_process(order))
-                     # Cambiar estado para evitar re-lanzamiento inmediato?
-                     # El propio proceso lo cambia a 'en_progreso' si consigue capacidad
-                 else:
-                     print(f"Day {int(self.env.now)}: Insufficient materials for Order {order.id}.")
-                     # Opcional: Log evento "MATERIAL_SHORTAGE_PRODUCTION"
+         """Revisa pedidos liberados y encola los que tienen material, reservándolo en lote."""
+         # Stock aún no reservado en esta pasada: un pedido solo se encola si su
+         # BOM cabe en lo que dejaron los anteriores, así no se detiene luego por
+         # falta de material consumido por otro pedido liberado a la vez
+         available = self.inventory_array.copy()
+         # Los pedidos encolados en pasadas anteriores y aún sin empezar (p. ej. con
+         # production_step_time > 0 y más pedidos que despachadores) tienen su
+         # material reservado aunque todavía no se haya descontado del inventario
+         for queued in self.production_queue.items:
+             np.subtract.at(available, self._bom_pos[queued.product_id],
+                            self.bom_qty[queued.product_id] * queued.quantity)
+         # Solo se recorren los pedidos liberados; en orden de ID (= orden de creación)
+         for order_id in sorted(self.released_orders):
+             order = self.production_orders_by_id[order_id]
+             if order.status != "liberado":
+                 self.released_orders.discard(order_id)
+                 continue
+             if self.log_events: print(f"Day {self.current_day}: Checking materials for released Order {order.id} ({order.quantity}x{order.product_id})")
+             bom_pos = self._bom_pos.get(order.product_id)
+             if bom_pos is None:
+                 print(f"Warning: No BOM found for product {order.product_id}")
+                 fits = False
+             elif order.product_id in self._incomplete_boms:
+                 fits = False
+             else:
+                 needed = self.bom_qty[order.product_id] * order.quantity
+                 fits = bool((available[bom_pos] >= needed).all())
+             if fits:
+                 np.subtract.at(available, bom_pos, needed)
+                 if self.log_events: print(f"Day {self.current_day}: Materials OK for Order {order.id}. Queued for production.")
+                 # Encolar la orden para los despachadores; sale del conjunto para no
+                 # encolarla otra vez mientras espera (production_process la pasa a 'en_progreso')
+                 self.production_queue.put(order)
+                 self.released_orders.discard(order_id)
+             else:
+                 if self.log_events: print(f"Day {self.current_day}: Insufficient materials for Order {order.id}.")
+                 # Opcional: Log evento "MATERIAL_SHORTAGE_PRODUCTION"
 
     def run_day(self):
         """Avanza la simulación un día."""
@@ -280,6 +591,8 @@ class SimulationEnvironment:
         # 3. Ejecutar la simulación hasta el final del día
         print(f"Running simulation until end of Day {self.current_day} (Time: {target_day})...")
         self.env.run(until=target_day)
+        self._orders_dirty = True # Durante el día se crean pedidos y cambian estados
+        self.state_version += 1
 
         # 4. Actualizar día actual
         self.current_day = target_day
@@ -289,9 +602,12 @@ class SimulationEnvironment:
 
     def release_order(self, order_id: int):
         """Marca un pedido como listo para producción (si existe y está pendiente)."""
-        order = next((o for o in self.production_orders if o.id == order_id), None)
+        order = self.production_orders_by_id.get(order_id)
         if order and order.status == "pendiente":
             order.status = "liberado"
+            self.released_orders.add(order_id)
+            self._orders_dirty = True
+            self.state_version += 1
             print(f"Order {order_id} released for production.")
             self.log_event("ORDER_RELEASED", {"order_id": order_id})
             # La producción se intentará iniciar en el próximo check_and_start_production()
@@ -304,7 +620,7 @@ class SimulationEnvironment:
          """Crea una orden de compra y lanza su proceso de seguimiento."""
          supplier = self.get_supplier(supplier_id)
          product = self.get_product(product_id)
-         if not supplier or not product or product.type != 'raw':
+         if not supplier or not product or product.type != RAW:
               print(f"Error: Invalid supplier ({supplier_id}) or raw material ({product_id}) for purchase.")
               return None
          if product_id not in supplier.supply_details:
@@ -315,7 +631,7 @@ class SimulationEnvironment:
              return None
 
          cost, lead_time = supplier.supply_details[product_id]
-         emission_day = int(self.env.now) # Día actual
+         emission_day = self.current_day # Día actual
 
          new_po = PurchaseOrder(
              id=self.next_purchase_order_id,
@@ -327,6 +643,7 @@ class SimulationEnvironment:
          )
          self.purchase_orders.append(new_po)
          self.next_purchase_order_id += 1
+         self.state_version += 1
 
          print(f"Day {emission_day}: Created Purchase Order {new_po.id} for {quantity}x{product_id} from Supplier {supplier_id}.")
          self.log_event("PURCHASE_ORDER_CREATED", {"po_id": new_po.id, "supplier_id": supplier_id, "product_id": product_id, "quantity": quantity})
@@ -338,26 +655,39 @@ class SimulationEnvironment:
 
     def calculate_total_material_needs(self, orders: List[ProductionOrder]) -> Dict[int, int]:
         """Calcula la suma total de cada materia prima necesaria para una lista de pedidos."""
-        total_needs = {}
-        for order in orders:
-            if order.status not in ["completado", "cancelado"]: # Considerar solo pedidos activos/pendientes
-                bom = self.get_bom(order.product_id)
-                if bom:
-                    for item in bom:
-                        needed = item.quantity * order.quantity
-                        total_needs[item.material_id] = total_needs.get(item.material_id, 0) + needed
-        return total_needs
+        needs = self._active_needs(orders)
+        mask = needs > 0
+        return dict(zip(self.product_ids[mask].tolist(), needs[mask].tolist()))
+
+    def _active_needs(self, orders: List[ProductionOrder]) -> np.ndarray:
+        """Vector de necesidades (alineado con self.product_ids) de los pedidos activos/pendientes."""
+        active = [o for o in orders
+                  if o.status not in ("completado", "cancelado") and o.product_id in self._pid_index]
+        return self.calculate_needs_vector([o.product_id for o in active], [o.quantity for o in active])
+
+    def calculate_needs_vector(self, product_ids, quantities) -> np.ndarray:
+        """
+        Calcula las necesidades totales de material para pares (producto, cantidad).
+
+        Devuelve un array alineado con self.product_ids (posición i = producto
+        con ID self.product_ids[i]).
+        """
+        out = np.zeros(len(self.product_ids), dtype=np.int64)
+        if len(product_ids):
+            order_prod_idx = np.fromiter((self._pid_index[pid] for pid in product_ids),
+                                         dtype=np.int64, count=len(product_ids))
+            _accumulate_needs(np.asarray(quantities, dtype=np.int64), order_prod_idx,
+                              self._bom_offsets, self._bom_mats, self._bom_unit_qty, out)
+        return out
 
     def calculate_shortages(self, orders_to_consider: List[ProductionOrder]) -> Dict[int, int]:
         """Calcula la cantidad faltante de cada materia prima para los pedidos dados."""
-        total_needs = self.calculate_total_material_needs(orders_to_consider)
-        shortages = {}
-        for material_id, needed_qty in total_needs.items():
-            available_qty = self.inventory.get(material_id, 0)
-            shortage = max(0, needed_qty - available_qty) # Faltante es lo necesario menos lo disponible (si es positivo)
-            if shortage > 0:
-                shortages[material_id] = shortage
-        return shortages
+        needs = self._active_needs(orders_to_consider)
+        # Faltante es lo necesario menos lo disponible (si es positivo); ambos
+        # arrays están alineados con self.product_ids
+        shortage = np.clip(needs - self.inventory_array, 0, None)
+        mask = shortage > 0
+        return dict(zip(self.product_ids[mask].tolist(), shortage[mask].tolist()))
 
 
 # --- Bloque para probar la simulación directamente (opcional) ---